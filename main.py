@@ -2,16 +2,43 @@
 Math Flash Cards Website - Main Application
 A Flask-based web application for creating and practicing math flashcards.
 Uses CSV files for data storage (users and flashcards).
+Flashcard images are stored as separate files in the images directory.
 """
 
 # Flask imports - web framework for handling HTTP requests and rendering templates
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, abort
 # CSV module - for reading/writing CSV files (user and flashcard data)
 import csv
 # OS module - for file system operations (checking if files exist)
 import os
+# Base64 module - for decoding uploaded images before writing them to disk
+import base64
+import binascii
+# IO module - for serializing CSV rows in memory before appending them
+import io
+# Pickle module - for saving the parsed flashcards next to the CSV (fast restarts)
+import pickle
+# Shutil module - for copying the images of renumbered flashcards
+import shutil
+# Tempfile module - for unique temporary files when writing the snapshot
+import tempfile
+# Functools/itertools - for memoizing per-user collection lists
+import functools
+import itertools
+# Contextlib/threading - for serializing writes to the CSV files
+import contextlib
+import threading
+# Fcntl module - for locking the CSV files across worker processes (not available on Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 # Datetime module - for timestamp generation when creating records
 from datetime import datetime
+# HMAC module - for constant-time comparison of legacy plain-text passwords
+import hmac
+# Werkzeug security helpers (installed with Flask) - for salted password hashing
+from werkzeug.security import generate_password_hash, check_password_hash
 
 # Increase CSV field size limit to handle large base64-encoded images
 # Default limit is 131072 bytes (128KB), which is too small for images
@@ -27,30 +54,75 @@ app.secret_key = 'your-secret-key-here'  # Required for flash messages and sessi
 # CSV file paths - constants for data storage files
 USERS_CSV = 'users.csv'  # Stores user account information
 FLASHCARDS_CSV = 'flashcards.csv'  # Stores all flashcard data
+FLASHCARDS_SNAPSHOT = 'flashcards.pkl'  # Parsed copy of flashcards.csv, reused on restart
+SNAPSHOT_FORMAT = 2  # Changed whenever the table layout changes, so older snapshots are ignored
+IMAGES_DIR = 'images'  # Stores flashcard images (one file per card side)
+CSV_LOCK = 'csv.lock'  # Locked while writing to the CSV files (shared by all worker processes)
+
+# Column positions in users.csv (rows are read with csv.reader, not DictReader)
+USER_COL_NAME, USER_COL_EMAIL, USER_COL_PASSWORD, USER_COL_CREATED = range(4)
+# Column positions in flashcards.csv
+COL_ID, COL_EMAIL, COL_NAME, COL_Q, COL_A, COL_IQ, COL_IA, COL_COLL, COL_CREATED = range(9)
+# Header of flashcards.csv; the extra trailing name marks the file as an append-only
+# log, in which a repeated ID is a new version of the same card (not a new card)
+FLASHCARDS_LOG_MARKER = 'log'
+FLASHCARDS_HEADER = ['id', 'user_email', 'name', 'question', 'answer', 'image_question', 'image_answer', 'collection', 'created_at', FLASHCARDS_LOG_MARKER]
+
+# Image MIME types that are written to disk, mapped to their file extension
+IMAGE_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
 
 # ============================================================================
 # CSV Initialization Functions
 # ============================================================================
 
+def _open_csv(path):
+    """
+    Open a CSV file for reading, without checking for it separately first.
+    Args:
+        path: Path of the CSV file
+    Returns:
+        Open file object, or None if the file doesn't exist
+    """
+    try:
+        return open(path, 'r', newline='', encoding='utf-8')
+    except FileNotFoundError:
+        return None
+
+def _create_csv(path, header):
+    """
+    Create a CSV file containing only a header row, unless it already exists.
+    Uses exclusive-create mode, so there is no separate existence check
+    (and no race between checking and creating).
+    Args:
+        path: Path of the CSV file
+        header: List of column names
+    """
+    try:
+        with open(path, 'x', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+    except FileExistsError:
+        pass  # Already initialized
+
 def init_users_csv():
     """
     Initialize the users CSV file with headers if it doesn't exist.
     Creates a new CSV file with columns: name, email, password, created_at
     """
-    if not os.path.exists(USERS_CSV):
-        with open(USERS_CSV, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['name', 'email', 'password', 'created_at'])
+    _create_csv(USERS_CSV, ['name', 'email', 'password', 'created_at'])
 
 def init_flashcards_csv():
     """
     Initialize the flashcards CSV file with headers if it doesn't exist.
     Creates a new CSV file with columns: id, user_email, name, question, answer, image_question, image_answer, collection, created_at
+    (and the FLASHCARDS_LOG_MARKER)
     """
-    if not os.path.exists(FLASHCARDS_CSV):
-        with open(FLASHCARDS_CSV, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['id', 'user_email', 'name', 'question', 'answer', 'image_question', 'image_answer', 'collection', 'created_at'])
+    _create_csv(FLASHCARDS_CSV, FLASHCARDS_HEADER)
 
 def migrate_flashcards_csv():
     """
@@ -60,15 +132,19 @@ def migrate_flashcards_csv():
     - Backs up the old file before migration
     - Assigns sequential IDs to existing cards
     - Sets empty collection and name for old cards
+    - Gives fresh IDs to cards sharing an ID (see renumber_duplicate_flashcard_ids)
     """
-    if not os.path.exists(FLASHCARDS_CSV):
+    file = _open_csv(FLASHCARDS_CSV)
+    if file is None:
         return
     
     # Read the current file to check if migration is needed
-    with open(FLASHCARDS_CSV, 'r', newline='', encoding='utf-8') as file:
+    with file:
         first_line = file.readline().strip()
         # Check if already has all required columns including images
         if 'id' in first_line and 'collection' in first_line and 'name' in first_line and 'image_question' in first_line:
+            if not first_line.endswith(',' + FLASHCARDS_LOG_MARKER):
+                renumber_duplicate_flashcard_ids()  # Written before the CSV was a log
             return  # Already migrated - no action needed
     
     # Backup the old file before migration
@@ -79,48 +155,687 @@ def migrate_flashcards_csv():
         backup_file = FLASHCARDS_CSV + '.backup.' + str(int(time.time()))
     os.rename(FLASHCARDS_CSV, backup_file)
     
-    # Read old format and write new format
-    migrated_cards = []
-    with open(backup_file, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
+    # Stream old format into new format row by row, so only one row is in memory
+    with open(backup_file, 'r', newline='', encoding='utf-8') as old_file, \
+            open(FLASHCARDS_CSV, 'w', newline='', encoding='utf-8') as new_file:
+        reader = csv.DictReader(old_file)
+        writer = csv.writer(new_file)
+        # Write new format with all required columns (IDs are unique, so it is a valid log)
+        writer.writerow(FLASHCARDS_HEADER)
         # Enumerate starts at 1 to assign IDs starting from 1
         for i, row in enumerate(reader, 1):
-            migrated_cards.append({
-                'id': i,
-                'user_email': row['user_email'],
-                'name': row.get('name', ''),  # Empty name for old cards (backward compatibility)
-                'question': row['question'],
-                'answer': row['answer'],
-                'image_question': row.get('image_question', ''),  # Empty image for old cards
-                'image_answer': row.get('image_answer', ''),  # Empty image for old cards
-                'collection': row.get('collection', ''),  # Empty collection for old cards if not present
-                'created_at': row['created_at']
-            })
-    
-    # Write new format with all required columns
-    with open(FLASHCARDS_CSV, 'w', newline='', encoding='utf-8') as file:
+            writer.writerow([
+                i,
+                row['user_email'].strip().lower(),  # Canonical lowercase email
+                row.get('name', ''),  # Empty name for old cards (backward compatibility)
+                row['question'],
+                row['answer'],
+                row.get('image_question', ''),  # Empty image for old cards
+                row.get('image_answer', ''),  # Empty image for old cards
+                row.get('collection', ''),  # Empty collection for old cards if not present
+                row['created_at']
+            ])
+
+# ============================================================================
+# CSV Cache Functions
+# ============================================================================
+
+# Value of the created_at column that marks a tombstone row (a deleted card)
+# Deleting in place overwrites created_at with this, padded with spaces
+DELETED_MARKER = 'DELETED'
+# Compact the flashcards CSV once more than this fraction of its rows are dead,
+# or more than this fraction of its bytes are padding left by in-place updates
+COMPACT_THRESHOLD = 0.3
+
+# Parsed CSV data per file path: {path: ((mtime_ns, size), value)}
+# For users.csv, value maps each lowercased email to that user's row
+# For flashcards.csv, value is a column-oriented table (see _new_flashcards_table)
+# Lets read-only requests skip re-parsing the CSV when it hasn't changed
+_CACHE = {}
+
+# Cache generation - changes whenever cached CSV data changes, so results
+# derived from the cache (see _user_collections) can be memoized per generation
+_GENERATION_COUNTER = itertools.count(1)
+_GEN = 0
+
+def _bump_generation():
+    """
+    Move to a new cache generation, retiring everything memoized for the old one.
+    Called whenever an entry of _CACHE is replaced or dropped.
+    """
+    global _GEN
+    _GEN = next(_GENERATION_COUNTER)
+
+# Serializes writes to the CSV files between threads of this process;
+# CSV_LOCK is locked as well, for other worker processes (e.g. under gunicorn)
+_WRITE_LOCK = threading.RLock()
+_write_lock_depth = 0
+
+@contextlib.contextmanager
+def _csv_write_lock():
+    """
+    Hold the CSV write lock, so no other thread or worker process writes meanwhile.
+    Reentrant: nested uses in the same thread only lock once. Reads done while
+    holding it (e.g. looking up the next ID) can't be invalidated by other writers.
+    """
+    global _write_lock_depth
+    with _WRITE_LOCK:
+        lock_file = None
+        if _write_lock_depth == 0:
+            lock_file = open(CSV_LOCK, 'a')
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _write_lock_depth += 1
+        try:
+            yield
+        finally:
+            _write_lock_depth -= 1
+            if lock_file is not None:
+                lock_file.close()  # Closing the file releases the lock
+
+def _load_cached(path, parse, default):
+    """
+    Get the parsed contents of a CSV file, re-parsing it only when it has changed.
+    The file's modification time and size are used to detect changes.
+    Args:
+        path: Path of the CSV file
+        parse: Function that parses the file and returns the value to cache
+        default: Value returned when the file doesn't exist
+    Returns:
+        The cached or freshly parsed value (shared with the cache - must not be modified)
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return default
+    key = (st.st_mtime_ns, st.st_size)
+    
+    cached = _CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]  # File unchanged since last parse
+    
+    value = parse()
+    _CACHE[path] = (key, value)
+    _bump_generation()
+    return value
+
+def _new_flashcards_table():
+    """
+    Create an empty flashcards table.
+    Cards are stored column by column (one list per CSV column) so filters
+    only touch the column they need; position i in every list is one card.
+    - 'columns': list of column lists, indexed by the COL_* constants
+    - 'email_keys': lowercased user email per position (None once deleted),
+      precomputed so ownership checks are a plain ==
+    - 'by_id': card ID -> position of its current version
+    - 'by_user': lowercased user email -> positions of that user's live cards,
+      so per-user lookups cost O(user's cards) instead of O(all cards)
+    - 'spans': (byte offset, byte length) of each card's current row in the file
+    - 'dead': number of superseded versions and tombstones still in the file
+    - 'padding': bytes of blank lines left in the file by in-place updates
+    - 'max_id': highest ID written so far
+    Returns:
+        Empty table dictionary
+    """
+    return {
+        'columns': [[] for _ in range(COL_CREATED + 1)],
+        'email_keys': [],
+        'by_id': {},
+        'by_user': {},
+        'spans': [],
+        'dead': 0,
+        'padding': 0,
+        'max_id': 0,
+    }
+
+def _copy_flashcards_table(table):
+    """
+    Copy a flashcards table so it can be changed without affecting readers of the original.
+    Args:
+        table: Table dictionary to copy
+    Returns:
+        New table dictionary with copied lists
+    """
+    return {
+        'columns': [list(column) for column in table['columns']],
+        'email_keys': list(table['email_keys']),
+        'by_id': dict(table['by_id']),
+        'by_user': {email_key: list(positions) for email_key, positions in table['by_user'].items()},
+        'spans': list(table['spans']),
+        'dead': table['dead'],
+        'padding': table['padding'],
+        'max_id': table['max_id'],
+    }
+
+def _remove_flashcard(table, card_id):
+    """
+    Remove a card from a flashcards table (its slot stays, but matches nothing).
+    Args:
+        table: Table dictionary being changed
+        card_id: ID of the card to remove
+    """
+    position = table['by_id'].pop(card_id)
+    table['by_user'][table['email_keys'][position]].remove(position)
+    table['email_keys'][position] = None
+
+def _apply_flashcard_row(table, row, span):
+    """
+    Replay one row of the flashcards CSV log onto a parsed table.
+    Args:
+        table: Table dictionary being built (see _new_flashcards_table)
+        row: Row in CSV column order (new card, new version or tombstone)
+        span: (byte offset, byte length) of the row in the file
+    """
+    columns = table['columns']
+    card_id = row[COL_ID]
+    position = table['by_id'].get(card_id)
+    if position is not None:
+        if row[COL_EMAIL].lower() != table['email_keys'][position]:
+            # Same ID but another owner - never a new version (duplicate IDs from
+            # before the log format are renumbered by migrate_flashcards_csv).
+            # It must never replace or delete the existing card, so it is skipped.
+            table['dead'] += 1
+            return
+        table['dead'] += 1  # Previous version is superseded
+    
+    if row[COL_CREATED].rstrip() == DELETED_MARKER:
+        if position is not None:
+            _remove_flashcard(table, card_id)
+        table['dead'] += 1  # The tombstone itself is dead too
+    elif position is not None:
+        # New version of an existing card - overwrite its slot in place
+        for col, column in enumerate(columns):
+            column[position] = row[col]
+        table['spans'][position] = span
+    else:
+        position = len(table['email_keys'])
+        table['by_id'][card_id] = position
+        for col, column in enumerate(columns):
+            column.append(row[col])
+        # Emails are written lowercased; lowering here covers rows from before that
+        email_key = row[COL_EMAIL].lower()
+        table['email_keys'].append(email_key)
+        table['by_user'].setdefault(email_key, []).append(position)  # New slots are always last
+        table['spans'].append(span)
+    
+    try:
+        table['max_id'] = max(table['max_id'], int(card_id))
+    except ValueError:
+        pass  # Skip rows with invalid ID format
+
+def _row_at(table, position):
+    """
+    Rebuild one CSV row from a flashcards table.
+    Args:
+        table: Table dictionary
+        position: Position of the card in the table
+    Returns:
+        Row in CSV column order
+    """
+    return [column[position] for column in table['columns']]
+
+def _parse_flashcards():
+    """
+    Parse the flashcards CSV into a table (see _CACHE).
+    The CSV is an append-only log: the last row written for an ID is the
+    current version of that card, and a tombstone row means it was deleted.
+    Returns:
+        Table dictionary (empty if the file doesn't exist)
+    """
+    table = _new_flashcards_table()
+    try:
+        file = open(FLASHCARDS_CSV, 'rb')
+    except FileNotFoundError:
+        return table  # Removed since it was checked (e.g. while being migrated)
+    with file:
+        # Feed the CSV reader one decoded line at a time while counting bytes,
+        # so the byte span of every row (even multi-line ones) is known
+        end = [0]
+        def lines():
+            for raw_line in file:
+                end[0] += len(raw_line)
+                yield raw_line.decode('utf-8')
+        
+        reader = csv.reader(lines())
+        next(reader, None)  # Skip header row
+        start = end[0]
+        for row in reader:
+            if len(row) > COL_CREATED:
+                _apply_flashcard_row(table, row, (start, end[0] - start))
+            else:
+                table['padding'] += end[0] - start  # Skip blank or malformed lines
+            start = end[0]
+    return table
+
+def _parse_flashcards_or_snapshot():
+    """
+    Get the parsed flashcards table, from the snapshot file if it is current.
+    The snapshot stores the CSV's (mtime_ns, size) and SNAPSHOT_FORMAT next to the table, so it is
+    only used if the CSV hasn't changed since it was written. Otherwise the CSV
+    is parsed and a new snapshot is written, so the next process start (or
+    cache miss) can skip the CSV tokenizer.
+    Returns:
+        Table dictionary (empty if the file doesn't exist)
+    """
+    try:
+        st = os.stat(FLASHCARDS_CSV)
+    except FileNotFoundError:
+        return _new_flashcards_table()  # Removed since it was checked (e.g. while being migrated)
+    key = (st.st_mtime_ns, st.st_size)
+    try:
+        with open(FLASHCARDS_SNAPSHOT, 'rb') as file:
+            snapshot_format, snapshot_key, table = pickle.load(file)
+        if snapshot_format == SNAPSHOT_FORMAT and snapshot_key == key:
+            return table
+    except Exception:
+        pass  # Missing, outdated format or corrupt snapshot - parse the CSV instead
+    
+    table = _parse_flashcards()
+    # Write to a temporary file first so a crash never leaves a half-written snapshot;
+    # the name is unique, so workers parsing at the same time don't write to the same file
+    try:
+        fd, temp_file = tempfile.mkstemp(prefix=FLASHCARDS_SNAPSHOT + '.', suffix='.tmp',
+                                         dir=os.path.dirname(os.path.abspath(FLASHCARDS_SNAPSHOT)))
+    except OSError:
+        return table  # The snapshot is only an optimization
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((SNAPSHOT_FORMAT, key, table), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, FLASHCARDS_SNAPSHOT)
+    except OSError:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+    return table
+
+def _load_flashcards_table():
+    """
+    Get the parsed flashcards CSV (cached until the file changes).
+    Returns:
+        Table dictionary (see _CACHE; shared with the cache - must not be modified)
+    """
+    return _load_cached(FLASHCARDS_CSV, _parse_flashcards_or_snapshot, _new_flashcards_table())
+
+def _load_flashcards():
+    """
+    Get the current version of every flashcard in the CSV (cached).
+    Returns:
+        List of rows in CSV column order
+    """
+    table = _load_flashcards_table()
+    return [_row_at(table, position) for position in table['by_id'].values()]
+
+def _invalidate_flashcards():
+    """
+    Drop the cached flashcard rows so the next read re-parses the CSV.
+    Called after every write to the flashcards CSV.
+    """
+    _CACHE.pop(FLASHCARDS_CSV, None)
+    _bump_generation()
+
+def _encode_flashcard_row(row):
+    """
+    Serialize one row exactly as a csv.writer on the flashcards CSV would.
+    Args:
+        row: Row in CSV column order (values already converted to strings)
+    Returns:
+        The row's bytes, including the line terminator
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue().encode('utf-8')
+
+def _read_row_terminator(file, span, row):
+    """
+    Check that a byte span of the flashcards CSV still holds the expected row.
+    Used before patching the file in place, so a stale offset never overwrites another row.
+    Args:
+        file: Flashcards CSV opened in binary read/write mode
+        span: (byte offset, byte length) of the row
+        row: Row (in CSV column order) that the span should contain
+    Returns:
+        The row's line terminator (b'\\r\\n' or b'\\n'), or None if the bytes don't match
+    """
+    offset, length = span
+    file.seek(offset)
+    raw_row = file.read(length)
+    terminator = b'\r\n' if raw_row.endswith(b'\r\n') else b'\n'
+    # ID is the first field and created_at the last, both written unquoted
+    if (raw_row.startswith(row[COL_ID].encode('utf-8') + b',')
+            and raw_row.endswith(b',' + row[COL_CREATED].encode('utf-8') + terminator)):
+        return terminator
+    return None
+
+def _finish_write(file, before):
+    """
+    Flush a write to the flashcards CSV and make sure its modification time moved forward.
+    The cache key is (mtime_ns, size) and in-place writes keep the size; file
+    timestamps are coarse, so two writes within one clock tick could otherwise
+    leave the same key and other workers would keep serving their stale table.
+    Must be called with the CSV write lock held.
+    Args:
+        file: Flashcards CSV opened in binary mode, just written to
+        before: os.stat_result of the file before the write
+    Returns:
+        os.stat_result of the file after the write
+    """
+    file.flush()
+    after = os.fstat(file.fileno())
+    if after.st_mtime_ns <= before.st_mtime_ns:
+        os.utime(FLASHCARDS_CSV, ns=(after.st_atime_ns, before.st_mtime_ns + 1))
+        after = os.fstat(file.fileno())
+    return after
+
+def _store_patched_table(before, after, expected_size, table):
+    """
+    Put a table updated after a write into the cache, if the write was the only change.
+    Writers hold the CSV write lock, so the size check only catches writers
+    that bypass it (e.g. the file being edited by hand).
+    Args:
+        before: os.stat_result of the file before the write
+        after: os.stat_result of the file after the write
+        expected_size: File size the write should have produced
+        table: Updated copy of the cached table
+    """
+    if after.st_size == expected_size:
+        _CACHE[FLASHCARDS_CSV] = ((after.st_mtime_ns, after.st_size), table)
+        _bump_generation()
+    else:
+        _invalidate_flashcards()  # Another writer got in between
+
+@_csv_write_lock()
+def _append_flashcard_rows(rows):
+    """
+    Append rows (new cards, new versions or tombstones) to the flashcards CSV.
+    If the cache was up to date and nobody else wrote to the file meanwhile,
+    the rows are applied to a copy of the cached table instead of dropping it,
+    so consecutive saves never re-parse the file.
+    Args:
+        rows: List of rows, each a list of values in CSV column order
+    """
+    # Serialize up front so each row's size (and so its position) is known
+    rows = [[str(value) for value in row] for row in rows]
+    encoded_rows = [_encode_flashcard_row(row) for row in rows]
+    data = b''.join(encoded_rows)
+    
+    cached = _CACHE.get(FLASHCARDS_CSV)
+    with open(FLASHCARDS_CSV, 'ab') as file:
+        before = os.fstat(file.fileno())
+        file.write(data)
+        after = _finish_write(file, before)
+    
+    if cached is None or cached[0] != (before.st_mtime_ns, before.st_size):
+        _invalidate_flashcards()  # Cache was stale before the write
+        return
+    
+    # Copy before applying so requests iterating the old table are unaffected
+    table = _copy_flashcards_table(cached[1])
+    offset = before.st_size
+    for row, row_data in zip(rows, encoded_rows):
+        _apply_flashcard_row(table, row, (offset, len(row_data)))
+        offset += len(row_data)
+    _store_patched_table(before, after, before.st_size + len(data), table)
+
+@_csv_write_lock()
+def _update_flashcard_in_place(row):
+    """
+    Overwrite the current row of a card with its new version, if it fits.
+    The new row is written over the old one; any bytes left over are filled
+    with blank lines, which readers skip. They are counted in the table's
+    'padding', so compact_flashcards_if_needed reclaims them. Runs under the
+    CSV write lock, like _delete_flashcards_in_place.
+    Args:
+        row: New version of the card, in CSV column order (same ID and created_at)
+    Returns:
+        True if the row was patched in place, False if it must be appended instead
+    """
+    _load_flashcards_table()  # Pick up changes made by other workers before the lock was taken
+    cached = _CACHE.get(FLASHCARDS_CSV)
+    if cached is None:
+        return False
+    row = [str(value) for value in row]
+    data = _encode_flashcard_row(row)
+    
+    with open(FLASHCARDS_CSV, 'r+b') as file:
+        before = os.fstat(file.fileno())
+        if cached[0] != (before.st_mtime_ns, before.st_size):
+            return False  # File changed since it was cached - offsets can't be trusted
+        position = cached[1]['by_id'].get(row[COL_ID])
+        if position is None:
+            return False
+        offset, length = cached[1]['spans'][position]
+        if len(data) > length or _read_row_terminator(file, (offset, length), _row_at(cached[1], position)) is None:
+            return False  # New version is longer (or the old row looks wrong)
+        
+        file.seek(offset)
+        file.write(data + b'\n' * (length - len(data)))
+        after = _finish_write(file, before)
+    
+    table = _copy_flashcards_table(cached[1])
+    for col, column in enumerate(table['columns']):
+        column[position] = row[col]
+    table['spans'][position] = (offset, len(data))
+    table['padding'] += length - len(data)
+    _store_patched_table(before, after, before.st_size, table)
+    return True
+
+@_csv_write_lock()
+def _delete_flashcards_in_place(rows):
+    """
+    Delete cards by turning their current rows into tombstones in place.
+    The created_at field at the end of each row is overwritten with
+    DELETED_MARKER (padded to the same width), so the file size doesn't change
+    and the card's ID is kept - any older versions earlier in the file stay
+    superseded. Rows that can't be patched safely are returned so the caller
+    can append a tombstone for them instead. Runs under the CSV write lock, so
+    no other worker can write between reading the offsets and publishing the
+    patched table.
+    Args:
+        rows: Current rows (in CSV column order) of the cards to delete
+    Returns:
+        List of the rows that were not deleted in place
+    """
+    _load_flashcards_table()  # Pick up changes made by other workers before the lock was taken
+    cached = _CACHE.get(FLASHCARDS_CSV)
+    if cached is None:
+        return rows
+    table = _copy_flashcards_table(cached[1])
+    
+    remaining = []
+    with open(FLASHCARDS_CSV, 'r+b') as file:
+        before = os.fstat(file.fileno())
+        if cached[0] != (before.st_mtime_ns, before.st_size):
+            return rows  # File changed since it was cached - offsets can't be trusted
+        
+        for row in rows:
+            position = table['by_id'].get(row[COL_ID])
+            if position is None:
+                remaining.append(row)
+                continue
+            offset, length = table['spans'][position]
+            created_at = row[COL_CREATED].encode('utf-8')
+            # Only patch rows that still look exactly as expected
+            terminator = _read_row_terminator(file, (offset, length), row)
+            if terminator is None or len(created_at) < len(DELETED_MARKER):
+                remaining.append(row)
+                continue
+            file.seek(offset + length - len(terminator) - len(created_at))
+            file.write(DELETED_MARKER.encode('utf-8').ljust(len(created_at)))
+            _remove_flashcard(table, row[COL_ID])
+            table['dead'] += 1  # The patched row is now a tombstone
+        after = _finish_write(file, before)
+    
+    _store_patched_table(before, after, before.st_size, table)
+    return remaining
+
+@_csv_write_lock()
+def renumber_duplicate_flashcard_ids():
+    """
+    Give a fresh ID to every card that shares its ID with an earlier card,
+    then mark the flashcards CSV as a log (FLASHCARDS_LOG_MARKER).
+    Before IDs were allocated under the write lock, two workers saving at the
+    same time could give two different cards the same ID. In a log a repeated
+    ID is read as a new version of the card, which would hide the earlier card,
+    so files written before that are renumbered once. Every row is kept;
+    tombstones follow the newest card with their ID and owner.
+    """
+    with open(FLASHCARDS_CSV, 'r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        if header[-1:] == [FLASHCARDS_LOG_MARKER]:
+            return  # Another worker renumbered it first
+        rows = [row for row in reader if len(row) > COL_CREATED]
+    
+    next_id = 1
+    for row in rows:
+        try:
+            next_id = max(next_id, int(row[COL_ID]) + 1)
+        except ValueError:
+            pass  # Skip rows with invalid ID format
+    
+    used_ids = set()
+    newest_ids = {}  # (original ID, lowercased email) -> ID of the newest card with them
+    for row in rows:
+        key = (row[COL_ID], row[COL_EMAIL].lower())
+        if row[COL_CREATED].rstrip() == DELETED_MARKER:
+            row[COL_ID] = newest_ids.get(key, row[COL_ID])
+        elif row[COL_ID] in used_ids:
+            # Another card already has this ID - give this one the next free ID
+            card_id = str(next_id)
+            next_id += 1
+            for col in (COL_IQ, COL_IA):
+                # Image files are named after the card ID, so copy them to the new name
+                prefix = f'/{IMAGES_DIR}/{row[COL_ID]}_'
+                if row[col].startswith(prefix):
+                    filename = f'{card_id}_{row[col][len(prefix):]}'
+                    try:
+                        shutil.copyfile(os.path.join(IMAGES_DIR, row[col][len(f'/{IMAGES_DIR}/'):]),
+                                        os.path.join(IMAGES_DIR, filename))
+                    except OSError:
+                        pass  # Missing image - the URL just won't resolve, as before
+                    row[col] = f'/{IMAGES_DIR}/{filename}'
+            row[COL_ID] = card_id
+            newest_ids[key] = card_id
+        else:
+            used_ids.add(row[COL_ID])
+            newest_ids[key] = row[COL_ID]
+    _replace_flashcards_csv(rows)
+
+@_csv_write_lock()
+def compact_flashcards():
+    """
+    Rewrite the flashcards CSV keeping only the current version of each card.
+    Drops the superseded versions and padding left by updates and the tombstones
+    left by deletes, moves images still stored inline as base64 (cards created before images
+    were stored as files) out to the images directory, and lowercases emails
+    of cards written before emails were normalized.
+    """
+    rows = _load_flashcards()
+    moved_images = False
+    normalized_emails = False
+    for row in rows:
+        # Normalize emails of cards written before emails were stored lowercased
+        if row[COL_EMAIL] != row[COL_EMAIL].lower():
+            row[COL_EMAIL] = row[COL_EMAIL].lower()
+            normalized_emails = True
+        for col, side in ((COL_IQ, 'q'), (COL_IA, 'a')):
+            if row[col].startswith('data:image'):
+                image_url = save_image(row[COL_ID], side, row[col])
+                moved_images = moved_images or image_url != row[col]
+                row[col] = image_url
+    table = _load_flashcards_table()
+    if not moved_images and not normalized_emails and not table['dead'] and not table['padding']:
+        return  # Nothing to remove, move or normalize
+    
+    _replace_flashcards_csv(rows)
+
+def _replace_flashcards_csv(rows):
+    """
+    Replace the flashcards CSV with a new file holding the given rows.
+    The new file is written next to the old one and then swapped in.
+    Must be called with the CSV write lock held.
+    Args:
+        rows: List of rows in CSV column order
+    """
+    temp_file = FLASHCARDS_CSV + '.tmp'
+    with open(temp_file, 'w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
-        writer.writerow(['id', 'user_email', 'name', 'question', 'answer', 'image_question', 'image_answer', 'collection', 'created_at'])
-        for card in migrated_cards:
-            writer.writerow([card['id'], card['user_email'], card['name'], card['question'], card['answer'], card['image_question'], card['image_answer'], card['collection'], card['created_at']])
+        writer.writerow(FLASHCARDS_HEADER)
+        writer.writerows(rows)
+    # The new file must not get the (mtime, size) cache key of the old one
+    old_mtime_ns = os.stat(FLASHCARDS_CSV).st_mtime_ns
+    new_st = os.stat(temp_file)
+    if new_st.st_mtime_ns <= old_mtime_ns:
+        os.utime(temp_file, ns=(new_st.st_atime_ns, old_mtime_ns + 1))
+    os.replace(temp_file, FLASHCARDS_CSV)
+    _invalidate_flashcards()
+
+def compact_flashcards_if_needed():
+    """
+    Compact the flashcards CSV when too many of its rows are dead, or too
+    much of it is padding left by in-place updates.
+    Called after updates and deletes, which leave dead rows and padding behind.
+    """
+    table = _load_flashcards_table()
+    total = len(table['by_id']) + table['dead']
+    if ((total and table['dead'] / total > COMPACT_THRESHOLD)
+            or (table['padding'] and table['padding'] / os.stat(FLASHCARDS_CSV).st_size > COMPACT_THRESHOLD)):
+        compact_flashcards()
+
+def _parse_users():
+    """
+    Parse the users CSV into a dictionary keyed by lowercased email.
+    If an email appears more than once, the first account wins.
+    Returns:
+        Dictionary mapping lowercased email to the user's row (empty if the file doesn't exist)
+    """
+    users = {}
+    file = _open_csv(USERS_CSV)
+    if file is None:
+        return users  # Removed since it was checked
+    with file:
+        reader = csv.reader(file)
+        next(reader, None)  # Skip header row
+        for row in reader:
+            if len(row) > USER_COL_CREATED:
+                users.setdefault(row[USER_COL_EMAIL].lower(), row)
+    return users
+
+def _load_users():
+    """
+    Get the parsed users CSV (cached until the file changes).
+    Returns:
+        Dictionary mapping lowercased email to the user's row (must not be modified)
+    """
+    return _load_cached(USERS_CSV, _parse_users, {})
 
 # ============================================================================
 # User Management Functions
 # ============================================================================
 
+@_csv_write_lock()
 def save_user_to_csv(name, email, password):
     """
     Save user registration data to CSV file.
+    The email is stored lowercased and the password is stored as a salted hash.
     Args:
         name: User's full name
         email: User's email address (used as unique identifier)
-        password: User's password (stored in plain text - not secure for production)
+        password: User's password (only its hash is written to the CSV)
+    Raises:
+        ValueError: If an account with this email already exists
     """
+    # Emails are unique (case-insensitive) - never write a second account
+    if email_exists(email):
+        raise ValueError('Email already registered')
+    
     # Generate timestamp for when the account was created
     created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     with open(USERS_CSV, 'a', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
-        writer.writerow([name, email, password, created_at])
+        writer.writerow([name, email.strip().lower(), generate_password_hash(password), created_at])
+    _CACHE.pop(USERS_CSV, None)
 
 def email_exists(email):
     """
@@ -131,16 +846,64 @@ def email_exists(email):
     Returns:
         True if email exists, False otherwise
     """
-    if not os.path.exists(USERS_CSV):
-        return False
-    
-    # Case-insensitive email comparison
+    # Case-insensitive email lookup in the cached users
+    return email.strip().lower() in _load_users()
+
+def check_password(stored_password, password):
+    """
+    Check a password against the value stored in the users CSV.
+    Accounts created before password hashing still hold the plain-text
+    password; those are compared in constant time.
+    Args:
+        stored_password: Password column of the user's row (hash or legacy plain text)
+        password: Password entered by the user
+    Returns:
+        True if the password matches, False otherwise
+    """
+    if is_password_hash(stored_password):
+        return check_password_hash(stored_password, password)
+    return hmac.compare_digest(stored_password.encode('utf-8'), password.encode('utf-8'))
+
+def is_password_hash(stored_password):
+    """
+    Check whether a stored password is a hash (and not a legacy plain-text password).
+    Args:
+        stored_password: Password column of the user's row
+    Returns:
+        True if the value is a werkzeug password hash, False otherwise
+    """
+    return stored_password.startswith(('scrypt:', 'pbkdf2:'))
+
+@_csv_write_lock()
+def rehash_user_password(email, password):
+    """
+    Replace a user's legacy plain-text password in the users CSV with its hash.
+    Called after a successful login with a plain-text password, so those
+    passwords don't stay on disk. The file is rewritten next to the old one
+    and then swapped in.
+    Args:
+        email: User's email address
+        password: The (already verified) password
+    """
+    email_key = email.strip().lower()
     with open(USERS_CSV, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row['email'].lower() == email.lower():
-                return True
-    return False
+        rows = list(csv.reader(file))
+    
+    # Same row as _parse_users picks: the first account with this email
+    for row in rows[1:]:
+        if len(row) > USER_COL_CREATED and row[USER_COL_EMAIL].lower() == email_key:
+            if is_password_hash(row[USER_COL_PASSWORD]):
+                return  # Already hashed (e.g. by a concurrent login)
+            row[USER_COL_PASSWORD] = generate_password_hash(password)
+            break
+    else:
+        return
+    
+    temp_file = USERS_CSV + '.tmp'
+    with open(temp_file, 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerows(rows)
+    os.replace(temp_file, USERS_CSV)
+    _CACHE.pop(USERS_CSV, None)
 
 def verify_user(email, password):
     """
@@ -152,21 +915,88 @@ def verify_user(email, password):
     Returns:
         Dictionary with user data if credentials are valid, None otherwise
     """
-    if not os.path.exists(USERS_CSV):
+    # Case-insensitive email lookup, then password check
+    row = _load_users().get(email.strip().lower())
+    if row is None or not check_password(row[USER_COL_PASSWORD], password):
         return None
+    if not is_password_hash(row[USER_COL_PASSWORD]):
+        # Legacy plain-text password - store its hash instead from now on
+        try:
+            rehash_user_password(email, password)
+        except OSError:
+            pass  # Login still succeeds; the password is rehashed next time
     
-    # Case-insensitive email comparison, exact password match
-    with open(USERS_CSV, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            if row['email'].lower() == email.lower() and row['password'] == password:
-                # Return user data (excluding password for security)
-                return {
-                    'name': row['name'],
-                    'email': row['email'],
-                    'created_at': row['created_at']
-                }
-    return None
+    # Return user data (excluding password for security)
+    # The email is returned in its canonical lowercase form, as used for flashcards
+    return {
+        'name': row[USER_COL_NAME],
+        'email': row[USER_COL_EMAIL].lower(),
+        'created_at': row[USER_COL_CREATED]
+    }
+
+# ============================================================================
+# Image Storage Functions
+# ============================================================================
+
+def delete_image(card_id, side):
+    """
+    Delete the stored image file for one side of a flashcard, if any.
+    Args:
+        card_id: ID of the flashcard the image belongs to
+        side: 'q' for the question image, 'a' for the answer image
+    """
+    for ext in IMAGE_EXTENSIONS.values():
+        try:
+            os.remove(os.path.join(IMAGES_DIR, f'{card_id}_{side}.{ext}'))
+        except FileNotFoundError:
+            continue
+
+def delete_images(card_id):
+    """
+    Delete both stored image files (question and answer) of a flashcard.
+    Args:
+        card_id: ID of the flashcard whose images to delete
+    """
+    delete_image(card_id, 'q')
+    delete_image(card_id, 'a')
+
+def save_image(card_id, side, image_data):
+    """
+    Store a flashcard image on disk so the CSV only keeps a short URL.
+    Base64 data URLs (as sent by the forms) are decoded and written to
+    images/<card_id>_<side>.<ext>; any other value (including data URLs that
+    can't be decoded) is returned unchanged.
+    Args:
+        card_id: ID of the flashcard the image belongs to
+        side: 'q' for the question image, 'a' for the answer image
+        image_data: Data URL, existing image URL, or empty string to remove the image
+    Returns:
+        The value to store in the CSV column (image URL, or the original value)
+    """
+    if not image_data:
+        # Image removed - drop the old file so it can't be served again
+        delete_image(card_id, side)
+        return image_data
+    if not image_data.startswith('data:image'):
+        return image_data  # Already stored (URL) - nothing to do
+
+    # Data URL format: data:image/png;base64,<payload>
+    header, _, payload = image_data.partition(',')
+    mime_type = header[len('data:'):].split(';')[0]
+    ext = IMAGE_EXTENSIONS.get(mime_type)
+    if ext is None or not header.endswith(';base64'):
+        return image_data  # Unsupported format - keep it inline in the CSV
+    try:
+        image_bytes = base64.b64decode(payload)
+    except binascii.Error:
+        return image_data  # Malformed base64 (e.g. unpadded legacy data) - keep it inline too
+
+    delete_image(card_id, side)  # Remove a previous image with another extension
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    filename = f'{card_id}_{side}.{ext}'
+    with open(os.path.join(IMAGES_DIR, filename), 'wb') as file:
+        file.write(image_bytes)
+    return f'/{IMAGES_DIR}/{filename}'
 
 # ============================================================================
 # Flashcard Management Functions
@@ -174,25 +1004,13 @@ def verify_user(email, password):
 
 def get_next_flashcard_id():
     """
-    Get the next available flashcard ID by finding the maximum existing ID.
+    Get the next available flashcard ID.
+    The highest ID written to the CSV is tracked by the cached table, and
+    appending a card updates it in place, so no file scan is needed per save.
     Returns:
         Next available ID (max_id + 1), or 1 if no flashcards exist
     """
-    if not os.path.exists(FLASHCARDS_CSV):
-        return 1
-    
-    max_id = 0
-    with open(FLASHCARDS_CSV, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            try:
-                # Convert ID to integer and track the maximum
-                card_id = int(row.get('id', 0))
-                max_id = max(max_id, card_id)
-            except ValueError:
-                # Skip rows with invalid ID format
-                continue
-    return max_id + 1
+    return _load_flashcards_table()['max_id'] + 1
 
 def get_user_flashcards(user_email):
     """
@@ -202,26 +1020,20 @@ def get_user_flashcards(user_email):
     Returns:
         List of flashcard dictionaries, empty list if none exist
     """
-    if not os.path.exists(FLASHCARDS_CSV):
-        return []
-    
-    flashcards = []
-    with open(FLASHCARDS_CSV, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # Case-insensitive email matching
-            if row['user_email'].lower() == user_email.lower():
-                flashcards.append({
-                    'id': row['id'],
-                    'name': row.get('name', ''),  # Default to empty string if missing
-                    'question': row['question'],
-                    'answer': row['answer'],
-                    'image_question': row.get('image_question', ''),  # Default to empty string if missing
-                    'image_answer': row.get('image_answer', ''),  # Default to empty string if missing
-                    'collection': row.get('collection', ''),  # Default to empty string if missing
-                    'created_at': row['created_at']
-                })
-    return flashcards
+    table = _load_flashcards_table()
+    return [_flashcard_from_row(_row_at(table, position)) for position in _user_positions(table, user_email.lower())]
+
+def _user_positions(table, email_key):
+    """
+    Find the positions of a user's flashcards in a flashcards table.
+    Uses the per-user index, so only this user's cards are visited.
+    Args:
+        table: Table dictionary
+        email_key: Lowercased email of the user
+    Returns:
+        List of positions, in the order the cards were created (must not be modified)
+    """
+    return table['by_user'].get(email_key, [])
 
 def get_user_collections(user_email):
     """
@@ -232,12 +1044,35 @@ def get_user_collections(user_email):
     Returns:
         Sorted list of unique collection names
     """
-    flashcards = get_user_flashcards(user_email)
-    collections = set()  # Use set to automatically handle uniqueness
-    for card in flashcards:
-        if card['collection']:  # Only add non-empty collections
-            collections.add(card['collection'])
-    return sorted(list(collections))  # Return sorted list for consistent display
+    _load_flashcards_table()  # Pick up changes to the file before reading the generation
+    return list(_user_collections(user_email.lower(), _GEN))
+
+@functools.lru_cache(maxsize=1024)
+def _user_collections(email_key, generation):
+    """
+    Compute a user's collection names (memoized per cache generation).
+    Args:
+        email_key: Lowercased email of the user
+        generation: Cache generation the result belongs to (only used as memoization key)
+    Returns:
+        Sorted tuple of unique, non-empty collection names
+    """
+    table = _load_flashcards_table()
+    collection_column = table['columns'][COL_COLL]
+    # Set comprehension handles uniqueness; skip empty (uncategorized) collections
+    return tuple(sorted({collection_column[position] for position in _user_positions(table, email_key)
+                         if collection_column[position]}))
+
+def get_user_flashcards_and_collections(user_email):
+    """
+    Get a user's flashcards and collection names together.
+    Used by pages that need both; the collections come from the memoized cache.
+    Args:
+        user_email: Email of the user whose flashcards and collections to retrieve
+    Returns:
+        Tuple of (list of flashcard dictionaries, sorted list of unique collection names)
+    """
+    return get_user_flashcards(user_email), get_user_collections(user_email)
 
 def save_flashcard(user_email, name, question, answer, collection='', image_question='', image_answer=''):
     """
@@ -253,22 +1088,58 @@ def save_flashcard(user_email, name, question, answer, collection='', image_ques
     Returns:
         The ID of the newly created flashcard
     """
+    return save_flashcards_bulk(user_email, [{
+        'name': name,
+        'question': question,
+        'answer': answer,
+        'collection': collection,
+        'image_question': image_question,
+        'image_answer': image_answer,
+    }])[0]
+
+@_csv_write_lock()
+def save_flashcards_bulk(user_email, cards):
+    """
+    Save several new flashcards for a user at once (e.g. when importing a deck).
+    The CSV is checked, the next ID looked up and the file appended to only
+    once for the whole batch. All of it happens under the CSV write lock, so
+    two workers never hand out the same ID.
+    Args:
+        user_email: Email of the user creating the flashcards
+        cards: List of dictionaries with 'question' and 'answer', and optionally
+               'name', 'collection', 'image_question' and 'image_answer'
+    Returns:
+        List of the IDs of the newly created flashcards, in the same order as cards
+    """
+    # Store the email in its canonical lowercase form
+    user_email = user_email.strip().lower()
     # Ensure CSV file exists with proper headers
     init_flashcards_csv()
-    # Get next available ID
-    card_id = get_next_flashcard_id()
-    # Generate timestamp
+    # Get next available ID (re-read under the lock); the batch gets consecutive IDs from there
+    next_id = get_next_flashcard_id()
+    # Generate timestamp (shared by the whole batch)
     created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    # Append new flashcard to CSV file
-    with open(FLASHCARDS_CSV, 'a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([card_id, user_email, name, question, answer, image_question, image_answer, collection, created_at])
-    return card_id
+    
+    rows = []
+    for card_id, card in enumerate(cards, next_id):
+        # Write images to disk and keep only their URLs in the CSV
+        image_question = save_image(card_id, 'q', card.get('image_question', ''))
+        image_answer = save_image(card_id, 'a', card.get('image_answer', ''))
+        rows.append([card_id, user_email, card.get('name', ''), card['question'], card['answer'],
+                     image_question, image_answer, card.get('collection', ''), created_at])
+    
+    # Append all new flashcards to the CSV file in one write
+    if rows:
+        _append_flashcard_rows(rows)
+    return [row[COL_ID] for row in rows]
 
+@_csv_write_lock()
 def update_flashcard(card_id, user_email, name, question, answer, collection='', image_question='', image_answer=''):
     """
-    Update an existing flashcard.
-    Reads all flashcards, updates the matching one, and writes all back.
+    Update an existing flashcard without rewriting the whole CSV.
+    If the new version fits in the old row's bytes it is written over it;
+    otherwise it is appended, and the old version is ignored by readers and
+    removed on compaction.
     Args:
         card_id: ID of the flashcard to update
         user_email: Email of the user (for security - ensures user owns the card)
@@ -281,67 +1152,86 @@ def update_flashcard(card_id, user_email, name, question, answer, collection='',
     Returns:
         True if update was successful, False otherwise
     """
-    if not os.path.exists(FLASHCARDS_CSV):
+    # Find the card to update (must match both ID and user email for security)
+    row = _find_flashcard_row(card_id, user_email)
+    if row is None:
         return False
     
-    # Read all flashcards
-    flashcards = []
-    with open(FLASHCARDS_CSV, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # Find the card to update (must match both ID and user email for security)
-            if row['id'] == str(card_id) and row['user_email'].lower() == user_email.lower():
-                # Update this card's fields
-                row['name'] = name
-                row['question'] = question
-                row['answer'] = answer
-                row['collection'] = collection
-                # Update images (only if provided, otherwise keep existing)
-                if image_question is not None:
-                    row['image_question'] = image_question
-                if image_answer is not None:
-                    row['image_answer'] = image_answer
-            flashcards.append(row)
-    
-    # Write back all flashcards (including the updated one)
-    with open(FLASHCARDS_CSV, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(['id', 'user_email', 'name', 'question', 'answer', 'image_question', 'image_answer', 'collection', 'created_at'])
-        for card in flashcards:
-            writer.writerow([card['id'], card['user_email'], card.get('name', ''), card['question'], card['answer'], card.get('image_question', ''), card.get('image_answer', ''), card.get('collection', ''), card['created_at']])
+    # Update images (only if provided, otherwise keep existing)
+    image_question_value = row[COL_IQ]
+    image_answer_value = row[COL_IA]
+    if image_question is not None:
+        image_question_value = save_image(card_id, 'q', image_question)
+    if image_answer is not None:
+        image_answer_value = save_image(card_id, 'a', image_answer)
+    
+    # New version of the card (same ID, original creation time)
+    new_row = [row[COL_ID], row[COL_EMAIL], name, question, answer, image_question_value, image_answer_value, collection, row[COL_CREATED]]
+    # Overwrite the old row in place if the new one fits, otherwise append it
+    if not _update_flashcard_in_place(new_row):
+        _append_flashcard_rows([new_row])
+    compact_flashcards_if_needed()
     
     return True
 
+@_csv_write_lock()
 def delete_flashcard(card_id, user_email):
     """
-    Delete a flashcard by reading all flashcards except the one to delete.
+    Delete a flashcard by turning its row in the CSV into a tombstone.
     Args:
         card_id: ID of the flashcard to delete
         user_email: Email of the user (for security - ensures user owns the card)
     Returns:
         True if deletion was successful, False otherwise
     """
-    if not os.path.exists(FLASHCARDS_CSV):
+    # Find the card to delete (must match both ID and user email for security)
+    row = _find_flashcard_row(card_id, user_email)
+    if row is None:
         return False
     
-    # Read all flashcards except the one to delete
-    flashcards = []
-    with open(FLASHCARDS_CSV, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # Keep all cards except the one matching both ID and user email
-            if not (row['id'] == str(card_id) and row['user_email'].lower() == user_email.lower()):
-                flashcards.append(row)
-    
-    # Write back all flashcards except the deleted one
-    with open(FLASHCARDS_CSV, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(['id', 'user_email', 'name', 'question', 'answer', 'image_question', 'image_answer', 'collection', 'created_at'])
-        for card in flashcards:
-            writer.writerow([card['id'], card['user_email'], card.get('name', ''), card['question'], card['answer'], card.get('image_question', ''), card.get('image_answer', ''), card.get('collection', ''), card['created_at']])
+    delete_images(row[COL_ID])
+    # Fall back to appending a tombstone if the row can't be patched in place
+    for row in _delete_flashcards_in_place([row]):
+        _append_flashcard_rows([[row[COL_ID], row[COL_EMAIL], '', '', '', '', '', '', DELETED_MARKER]])
+    compact_flashcards_if_needed()
     
     return True
 
+def _find_flashcard_row(card_id, user_email):
+    """
+    Find the current CSV row of a flashcard, ensuring it belongs to the specified user.
+    Args:
+        card_id: ID of the flashcard to find
+        user_email: Email of the user (for security)
+    Returns:
+        Row in CSV column order, None if not found
+    """
+    table = _load_flashcards_table()
+    position = table['by_id'].get(str(card_id))
+    # Must match both ID and user email for security
+    if position is None or table['email_keys'][position] != user_email.lower():
+        return None
+    return _row_at(table, position)
+
+def _flashcard_from_row(row):
+    """
+    Convert a flashcards CSV row into the flashcard dictionary used by the templates.
+    Args:
+        row: Row in CSV column order
+    Returns:
+        Dictionary with flashcard data (user email excluded)
+    """
+    return {
+        'id': row[COL_ID],
+        'name': row[COL_NAME],
+        'question': row[COL_Q],
+        'answer': row[COL_A],
+        'image_question': row[COL_IQ],
+        'image_answer': row[COL_IA],
+        'collection': row[COL_COLL],
+        'created_at': row[COL_CREATED]
+    }
+
 def get_flashcard_by_id(card_id, user_email):
     """
     Get a specific flashcard by ID, ensuring it belongs to the specified user.
@@ -351,25 +1241,10 @@ def get_flashcard_by_id(card_id, user_email):
     Returns:
         Dictionary with flashcard data if found, None otherwise
     """
-    if not os.path.exists(FLASHCARDS_CSV):
+    row = _find_flashcard_row(card_id, user_email)
+    if row is None:
         return None
-    
-    with open(FLASHCARDS_CSV, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # Must match both ID and user email for security
-            if row['id'] == str(card_id) and row['user_email'].lower() == user_email.lower():
-                return {
-                    'id': row['id'],
-                    'name': row.get('name', ''),
-                    'question': row['question'],
-                    'answer': row['answer'],
-                    'image_question': row.get('image_question', ''),
-                    'image_answer': row.get('image_answer', ''),
-                    'collection': row.get('collection', ''),
-                    'created_at': row['created_at']
-                }
-    return None
+    return _flashcard_from_row(row)
 
 # ============================================================================
 # Flask Route Handlers
@@ -399,11 +1274,27 @@ def practice():
     migrate_flashcards_csv()
     
     # Get user's flashcards and collections to display
-    user_flashcards = get_user_flashcards(session['user']['email'])
-    user_collections = get_user_collections(session['user']['email'])
+    user_flashcards, user_collections = get_user_flashcards_and_collections(session['user']['email'])
     return render_template("practice.html", flashcards=user_flashcards, collections=user_collections)
 
 
+@app.route("/api/flashcards")
+def api_flashcards():
+    """
+    JSON version of the practice page data - the user's flashcards and collections.
+    Lets the frontend refresh its card list without re-rendering the whole page.
+    Requires user to be logged in.
+    """
+    if 'user' not in session:
+        return jsonify({'error': 'Please log in to access your flashcards.'}), 401
+    
+    # Migrate flashcards if needed (same as the practice page, which this mirrors)
+    migrate_flashcards_csv()
+    
+    user_flashcards, user_collections = get_user_flashcards_and_collections(session['user']['email'])
+    return jsonify({'flashcards': user_flashcards, 'collections': user_collections})
+
+
 @app.route("/add_flashcard", methods=['POST'])
 def add_flashcard():
     """
@@ -508,6 +1399,25 @@ def delete_flashcard_route(card_id):
     return redirect(url_for('practice'))
 
 
+@app.route("/images/<path:filename>")
+def flashcard_image(filename):
+    """
+    Serve a stored flashcard image.
+    Only the owner of the flashcard may view its images.
+    Args:
+        filename: Image file name, formatted as <card_id>_<side>.<ext>
+    """
+    if 'user' not in session:
+        abort(404)
+    
+    # The card ID prefix is used to check ownership before serving the file
+    card_id = filename.split('_', 1)[0]
+    if not card_id.isdigit() or get_flashcard_by_id(card_id, session['user']['email']) is None:
+        abort(404)
+    
+    return send_from_directory(os.path.abspath(IMAGES_DIR), filename)
+
+
 @app.route("/login", methods=['GET', 'POST'])
 def login():
     """
@@ -618,34 +1528,32 @@ def delete_collection_route(collection_name):
     return redirect(url_for('practice'))
 
 
+@_csv_write_lock()
 def delete_collection(collection_name, user_email):
     """
     Delete all flashcards in a specific collection for a user.
-    Reads all flashcards, filters out those in the collection, and writes back.
+    Turns the row of every flashcard in the collection into a tombstone.
     Args:
         collection_name: Name of the collection to delete
         user_email: Email of the user (for security)
     Returns:
         True if deletion was successful, False otherwise
     """
-    if not os.path.exists(FLASHCARDS_CSV):
+    # Find all cards matching the collection name and user email
+    table = _load_flashcards_table()
+    collection_column = table['columns'][COL_COLL]
+    rows = [_row_at(table, position) for position in _user_positions(table, user_email.lower())
+            if collection_column[position] == collection_name]
+    if not rows:
         return False
     
-    # Read all flashcards except those in the collection to delete
-    flashcards = []
-    with open(FLASHCARDS_CSV, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # Keep all cards except those matching the collection name and user email
-            if not (row['collection'] == collection_name and row['user_email'].lower() == user_email.lower()):
-                flashcards.append(row)
-    
-    # Write back all flashcards except the deleted ones
-    with open(FLASHCARDS_CSV, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(['id', 'user_email', 'name', 'question', 'answer', 'image_question', 'image_answer', 'collection', 'created_at'])
-        for card in flashcards:
-            writer.writerow([card['id'], card['user_email'], card.get('name', ''), card['question'], card['answer'], card.get('image_question', ''), card.get('image_answer', ''), card.get('collection', ''), card['created_at']])
+    for row in rows:
+        delete_images(row[COL_ID])
+    # Fall back to appending tombstones for rows that can't be patched in place
+    remaining = _delete_flashcards_in_place(rows)
+    if remaining:
+        _append_flashcard_rows([[row[COL_ID], row[COL_EMAIL], '', '', '', '', '', '', DELETED_MARKER] for row in remaining])
+    compact_flashcards_if_needed()
     
     return True
 
@@ -655,6 +1563,9 @@ def delete_collection(collection_name, user_email):
 # ============================================================================
 
 if __name__ == "__main__":
+    # Bring the flashcards CSV up to date and drop dead rows before serving
+    migrate_flashcards_csv()
+    compact_flashcards()
     # Run the Flask development server
     # debug=True enables auto-reload on code changes and detailed error pages
     app.run(debug=True)